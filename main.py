@@ -1,165 +1,282 @@
 import argparse
+import functools
 import json
-import os
 import re
-from collections import defaultdict
-from typing import Dict, List, Set, Tuple, Optional, Any
+import string
+import sys
+from typing import Dict, List, Set, Tuple, Optional, Any, Callable, Pattern
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, fall back to the standard json module
+    orjson = None
+
+# Remarks of information nodes that don't represent actual servers
+_INFO_RE = re.compile('|'.join(map(re.escape, ["最新网址", "剩余流量", "过期时间"])))
+# Region name anywhere in the remarks, in common formats like "XXX-01"
+_REGION_MID_RE = re.compile(r'([A-Za-z\s]+)[-\s]\d+')
+# Characters of a region prefix: ASCII letters and whitespace as matched by \s
+# (str.isspace() is false for every code point above U+3000)
+_PREFIX_CHARS = string.ascii_letters + ''.join(c for c in map(chr, range(0x3001)) if c.isspace())
+
+# Progress messages, written to stdout in one batch by _flush_log
+_LOG: List[str] = []
+# Number of _flushes_log calls in progress; the outermost one flushes _LOG
+_LOG_DEPTH = 0
+
+
+def _log(message: str) -> None:
+    """Queue a progress message for output.
+    Args:
+        message: Message to print
+    """
+    _LOG.append(message)
+
+
+def _flush_log() -> None:
+    """Write all queued progress messages to stdout with a single write."""
+    if _LOG:
+        sys.stdout.write("\n".join(_LOG) + "\n")
+        _LOG.clear()
+
+
+def _flushes_log(func: Callable[..., Any]) -> Callable[..., Any]:
+    """Flush queued progress messages when the decorated function returns or raises.
+    Nested calls leave the flush to the outermost decorated call, so a whole conversion
+    is still written at once while helpers called directly print their own messages.
+    Args:
+        func: Function that queues messages with _log
+    Returns:
+        Wrapped function
+    """
+    @functools.wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        global _LOG_DEPTH
+        _LOG_DEPTH += 1
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _LOG_DEPTH -= 1
+            if not _LOG_DEPTH:
+                _flush_log()
+    return wrapper
+
+
+def _extract_prefix(remarks: str) -> Optional[str]:
+    r"""Return the region name at the beginning of the remarks, up to the first hyphen or digit.
+    Equivalent to matching r'^([A-Za-z\s]+)[\-\d]' without running the regex engine.
+    Args:
+        remarks: Node remarks
+    Returns:
+        The stripped prefix, or None if the remarks don't start with a region name
+    """
+    # str.lstrip scans the prefix characters in C
+    rest = remarks.lstrip(_PREFIX_CHARS)
+    if rest and len(rest) < len(remarks) and (rest[0] == '-' or rest[0].isdecimal()):
+        return remarks[:len(remarks) - len(rest)].strip()
+    return None
+
+
+def _compile_region_matcher(possible_regions: Set[str]) -> Optional[Pattern[str]]:
+    """Compile region names into a single pattern that finds the first region in one scan.
+    Longer names are tried first so that e.g. "Hong Kong" wins over "Hong" at the same position.
+    Args:
+        possible_regions: Set of possible region names
+    Returns:
+        Compiled pattern, or None if there are no regions
+    """
+    if not possible_regions:
+        return None
+    ordered = sorted(possible_regions, key=lambda region: (-len(region), region))
+    return re.compile('|'.join(map(re.escape, ordered)))
 
-import yaml
 
+def _read_json(path: str) -> Any:
+    """Read and parse a JSON file, using orjson when it is available.
+    Args:
+        path: Path to the JSON file
+    Returns:
+        Parsed JSON document
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _compose_yaml(content: str) -> Any:
+    """Parse a YAML document into its node graph, using libyaml's CSafeLoader when available.
+    Nodes keep their position in the text, so single values can be replaced without
+    rewriting the rest of the document.
+    PyYAML is imported here rather than at module level, since it is only needed when
+    a Docker Compose file is updated.
+    Args:
+        content: YAML text
+    Returns:
+        Root node of the document, or None if it is empty
+    """
+    import yaml
+    # CSafeLoader is missing when PyYAML was built without libyaml
+    return yaml.compose(content, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+
+
+def _find_v2ray_port_node(root: Any) -> Optional[Any]:
+    """Find the first port mapping of the v2ray service in a composed Docker Compose file.
+    Args:
+        root: Root node of the Docker Compose file
+    Returns:
+        Scalar node of services.v2ray.ports[0], or None if the file has no such entry
+    """
+    node = root
+    for key in ("services", "v2ray", "ports"):
+        if node is None or node.id != 'mapping':
+            return None
+        node = next((value for key_node, value in node.value if key_node.value == key), None)
+
+    if node is None or node.id != 'sequence' or not node.value or node.value[0].id != 'scalar':
+        return None
+    return node.value[0]
+
+
+@_flushes_log
 def load_shadowsocks_config(input_file: str) -> Tuple[List[Dict[str, Any]], bool]:
     try:
-        with open(input_file, 'r', encoding='utf-8') as f:
-            ss_configs = json.load(f)
-        print(f"Successfully loaded {len(ss_configs)} nodes from {input_file}")
+        ss_configs = _read_json(input_file)
+        _log(f"Successfully loaded {len(ss_configs)} nodes from {input_file}")
         return ss_configs, True
     except FileNotFoundError:
-        print(f"Error: Input file '{input_file}' not found")
+        _log(f"Error: Input file '{input_file}' not found")
         return [], False
     except json.JSONDecodeError:
-        print(f"Error: Input file '{input_file}' is not valid JSON")
+        _log(f"Error: Input file '{input_file}' is not valid JSON")
         return [], False
     except Exception as e:
-        print(f"Error loading input file: {str(e)}")
+        _log(f"Error loading input file: {str(e)}")
         return [], False
 
 
-def filter_info_nodes(ss_configs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    """Filter out information nodes that don't represent actual servers.
-    Args:
-        ss_configs: List of Shadowsocks configurations
-    Returns:
-        Filtered list of valid server nodes
+class _RegionExtreme:
+    """First and last node of a region, ordered by whether they start with the region name, then by remarks.
+    Updated as nodes arrive, so selecting them doesn't need a sort. Ties keep the earliest node
+    as first and the latest as last, as a stable sort would.
     """
-    info_keywords = ["最新网址", "剩余流量", "过期时间"]
-    valid_nodes = []
+    __slots__ = ("count", "first", "first_key", "last", "last_key")
 
-    for cfg in ss_configs:
-        if "remarks" in cfg and not any(keyword in cfg["remarks"] for keyword in info_keywords):
-            valid_nodes.append(cfg)
+    def __init__(self, node: Dict[str, Any], key: Tuple[bool, str]):
+        self.count = 1
+        self.first = self.last = node
+        self.first_key = self.last_key = key
 
-    print(f"Found {len(valid_nodes)} valid nodes after filtering info nodes")
-    return valid_nodes
+    def add(self, node: Dict[str, Any], key: Tuple[bool, str]) -> None:
+        self.count += 1
+        if key < self.first_key:
+            self.first, self.first_key = node, key
+        if key >= self.last_key:
+            self.last, self.last_key = node, key
 
 
-def extract_regions(nodes: List[Dict[str, Any]]) -> Set[str]:
-    """Extract possible region names from node remarks.
+@_flushes_log
+def select_region_nodes(ss_configs: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+    """Select representative nodes from each region.
+    Information nodes that don't represent actual servers are filtered out, region names are
+    extracted from node remarks and every node is assigned to a region. For each region, selects
+    up to two nodes - typically the first and last in sorted order. If a region has only one node,
+    that node is selected.
+    Region names are only known once all remarks have been seen, so this takes two passes: the
+    first filters nodes and extracts regions, the second assigns regions and tracks the selection.
     Args:
-        nodes: List of node configurations
+        ss_configs: List of Shadowsocks configurations
     Returns:
-        Set of possible region names
+        Tuple containing the selected node configurations and the number of regions
     """
+    # Filter out information nodes and extract possible region names
+    is_info = _INFO_RE.search
+    search_region = _REGION_MID_RE.search
+    valid_nodes = []
     possible_regions = set()
 
-    for node in nodes:
-        if "remarks" not in node:
+    for cfg in ss_configs:
+        if "remarks" not in cfg:
             continue
 
-        remarks = node["remarks"]
+        remarks = cfg["remarks"]
+        if is_info(remarks):
+            continue
 
         # Method 1: Assume region name is at the beginning until first hyphen or digit
-        region_match = re.match(r'^([A-Za-z\s]+)[\-\d]', remarks)
-        if region_match:
-            region = region_match.group(1).strip()
-            if region and len(region) > 1:  # Ensure region name is not a single letter
-                possible_regions.add(region)
-                continue
+        prefix = _extract_prefix(remarks)
+        valid_nodes.append((cfg, remarks, prefix))
+        if prefix and len(prefix) > 1:  # Ensure region name is not a single letter
+            possible_regions.add(prefix)
+            continue
 
         # Method 2: Try to match common region formats like "XXX-01"
-        region_match = re.search(r'([A-Za-z\s]+)[-\s]\d+', remarks)
+        region_match = search_region(remarks)
         if region_match:
             region = region_match.group(1).strip()
             if region and len(region) > 1:
                 possible_regions.add(region)
 
-    print(f"Detected {len(possible_regions)} possible regions from node names")
+    _log(f"Found {len(valid_nodes)} valid nodes after filtering info nodes")
+    _log(f"Detected {len(possible_regions)} possible regions from node names")
     if possible_regions:
-        print(f"  - Detected regions: {', '.join(sorted(possible_regions))}")
-
-    return possible_regions
-
+        _log(f"  - Detected regions: {', '.join(sorted(possible_regions))}")
+
+    # Group nodes by region, keeping the first and last node of each
+    region_matcher = _compile_region_matcher(possible_regions)
+    find_region = region_matcher.search if region_matcher else None
+    regions: Dict[str, _RegionExtreme] = {}
+
+    for node, remarks, prefix in valid_nodes:
+        # A node whose prefix is a region name (e.g. "Hong Kong-01") matches that region first,
+        # so only other nodes need a scan. Every valid prefix is a region name by now.
+        if prefix in possible_regions:
+            region = prefix
+        else:
+            region_match = find_region(remarks) if find_region else None
+            region = region_match.group() if region_match else None
 
-def group_nodes_by_region(nodes: List[Dict[str, Any]], possible_regions: Set[str]) -> Dict[str, List[Tuple[Dict[str, Any], bool]]]:
-    """Group nodes by their region based on extracted region names.
-    Args:
-        nodes: List of node configurations
-        possible_regions: Set of possible region names
-    Returns:
-        Dictionary mapping region names to lists of (node, starts_with_region) tuples
-    """
-    regions = defaultdict(list)
+        if region:
+            # Check if node name starts with the region
+            starts_with_region = remarks.startswith(region)
+        else:
+            # Categorize as "Other"
+            region = "Other"
+            starts_with_region = False
+            _log(f"Info: Node with remarks '{remarks}' assigned to 'Other' region")
+
+        key = (not starts_with_region, remarks)
+        extreme = regions.get(region)
+        if extreme is None:
+            regions[region] = _RegionExtreme(node, key)
+        else:
+            extreme.add(node, key)
 
-    for node in nodes:
-        if "remarks" not in node:
-            continue
+    _log(f"Grouped nodes into {len(regions)} regions")
+    for region, extreme in regions.items():
+        _log(f"  - {region}: {extreme.count} nodes")
 
-        remarks = node["remarks"]
-        assigned = False
-
-        # Try to match with extracted region names
-        for region in possible_regions:
-            if region in remarks:
-                # Check if node name starts with the region
-                starts_with_region = remarks.startswith(region)
-                # Add node to corresponding region with flag indicating if it starts with region name
-                regions[region].append((node, starts_with_region))
-                assigned = True
-                break
-
-        # If not assigned, try to extract region name again
-        if not assigned:
-            region_match = re.match(r'^([A-Za-z\s]+)[\-\d]', remarks)
-            if region_match:
-                region = region_match.group(1).strip()
-                if region and len(region) > 1:
-                    regions[region].append((node, True))
-                    assigned = True
-
-            # If still not assigned, categorize as "Other"
-            if not assigned:
-                regions["Other"].append((node, False))
-                print(f"Info: Node with remarks '{remarks}' assigned to 'Other' region")
-
-    print(f"Grouped nodes into {len(regions)} regions")
-    for region, nodes in regions.items():
-        print(f"  - {region}: {len(nodes)} nodes")
-
-    return regions
-
-
-def select_nodes_from_regions(regions: Dict[str, List[Tuple[Dict[str, Any], bool]]]) -> List[Dict[str, Any]]:
-    """Select representative nodes from each region.
-    For each region, selects up to two nodes - typically the first and last after sorting.
-    If a region has only one node, that node is selected.
-    Args:
-        regions: Dictionary mapping region names to lists of (node, starts_with_region) tuples
-    Returns:
-        List of selected node configurations
-    """
+    # Select nodes from each region
     valid_configs = []
 
-    for region, nodes in regions.items():
-        if not nodes:
-            continue
-
-        # Sort nodes by whether they start with region name, then by remarks
-        sorted_nodes = sorted(nodes, key=lambda x: (not x[1], x[0]["remarks"]))
-
-        if len(sorted_nodes) == 1:
+    for region, extreme in regions.items():
+        if extreme.count == 1:
             # If region has only one node, add it
-            valid_configs.append(sorted_nodes[0][0])
-            print(f"  - Selected 1 node from {region}: {sorted_nodes[0][0]['remarks']}")
+            valid_configs.append(extreme.first)
+            _log(f"  - Selected 1 node from {region}: {extreme.first['remarks']}")
         else:
             # Select first and last nodes from the region
-            selected_nodes = [sorted_nodes[0], sorted_nodes[-1]]
-            for node, starts_with_region in selected_nodes:
+            selected_nodes = [extreme.first, extreme.last]
+            for node in selected_nodes:
                 valid_configs.append(node)
-                print(f"  - Selected node from {region}: {node['remarks']}")
-            print(f"  - Total: Selected {len(selected_nodes)} nodes from {region}")
+                _log(f"  - Selected node from {region}: {node['remarks']}")
+            _log(f"  - Total: Selected {len(selected_nodes)} nodes from {region}")
 
-    return valid_configs
+    return valid_configs, len(regions)
 
 
+@_flushes_log
 def load_or_create_v2ray_config(output_file: str, append_mode: bool, start_port: int) -> Tuple[Dict[str, Any], int]:
     """Load existing V2Ray configuration or create a new one.
     Args:
@@ -179,22 +296,24 @@ def load_or_create_v2ray_config(output_file: str, append_mode: bool, start_port:
         }
     }
 
-    if append_mode and os.path.exists(output_file):
+    if append_mode:
         try:
-            with open(output_file, 'r', encoding='utf-8') as f:
-                v2ray_config = json.load(f)
-            print(f"Loaded existing configuration from {output_file} for appending")
+            v2ray_config = _read_json(output_file)
+            _log(f"Loaded existing configuration from {output_file} for appending")
 
-            # Get used ports to avoid port conflicts
-            used_ports = set(inbound['port'] for inbound in v2ray_config['inbounds'])
-            if used_ports and start_port <= max(used_ports):
-                start_port = max(used_ports) + 1
-                print(f"Adjusted start port to {start_port} to avoid conflicts")
+            # Get highest used port to avoid port conflicts
+            max_used_port = max((inbound['port'] for inbound in v2ray_config['inbounds']), default=-1)
+            if start_port <= max_used_port:
+                start_port = max_used_port + 1
+                _log(f"Adjusted start port to {start_port} to avoid conflicts")
 
             return v2ray_config, start_port
+        except FileNotFoundError:
+            # Nothing to append to yet
+            return default_config, start_port
         except Exception as e:
-            print(f"Error loading existing config file for appending: {str(e)}")
-            print("Creating new configuration instead")
+            _log(f"Error loading existing config file for appending: {str(e)}")
+            _log("Creating new configuration instead")
             return default_config, start_port
     else:
         return default_config, start_port
@@ -209,8 +328,9 @@ def create_v2ray_node_config(ss_cfg: Dict[str, Any], port: int) -> Tuple[Dict[st
         Tuple containing inbound, outbound, and routing rule configurations
     """
     # Create tag names based on port and node remarks
-    inbound_tag = f"in-{port}-{ss_cfg['remarks']}"
-    outbound_tag = f"out-{port}-{ss_cfg['remarks']}"
+    tag_suffix = str(port) + "-" + ss_cfg["remarks"]
+    inbound_tag = "in-" + tag_suffix
+    outbound_tag = "out-" + tag_suffix
 
     # Create inbound configuration (SOCKS5)
     inbound_config = {
@@ -253,6 +373,7 @@ def create_v2ray_node_config(ss_cfg: Dict[str, Any], port: int) -> Tuple[Dict[st
     return inbound_config, outbound_config, routing_rule
 
 
+@_flushes_log
 def write_v2ray_config(config: Dict[str, Any], output_file: str) -> bool:
     """Write V2Ray configuration to file.
     Args:
@@ -262,15 +383,20 @@ def write_v2ray_config(config: Dict[str, Any], output_file: str) -> bool:
         Boolean indicating success
     """
     try:
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=2, ensure_ascii=False)
-        print(f"Successfully wrote configuration to {output_file}")
+        if orjson is not None:
+            with open(output_file, 'wb') as f:
+                f.write(orjson.dumps(config, option=orjson.OPT_INDENT_2))
+        else:
+            with open(output_file, 'w', encoding='utf-8') as f:
+                json.dump(config, f, indent=2, ensure_ascii=False)
+        _log(f"Successfully wrote configuration to {output_file}")
         return True
     except Exception as e:
-        print(f"Error writing output file: {str(e)}")
+        _log(f"Error writing output file: {str(e)}")
         return False
 
 
+@_flushes_log
 def update_docker_compose(docker_compose_file: str, v2ray_config: Dict[str, Any], start_port: int) -> None:
     """Update Docker Compose file with port mappings.
     Args:
@@ -278,37 +404,42 @@ def update_docker_compose(docker_compose_file: str, v2ray_config: Dict[str, Any]
         v2ray_config: V2Ray configuration dictionary
         start_port: Starting port number
     """
-    if not os.path.exists(docker_compose_file):
-        print(f"Warning: Docker Compose file '{docker_compose_file}' not found, port mappings will not be updated")
-        return
-
     try:
         # Get all used ports
         all_ports = [inbound['port'] for inbound in v2ray_config['inbounds']]
         min_port = min(all_ports) if all_ports else start_port
         max_port = max(all_ports) if all_ports else start_port
+        port_mapping = f"{min_port}-{max_port}:{min_port}-{max_port}"
 
         # Read existing Docker Compose file
         with open(docker_compose_file, 'r', encoding='utf-8') as f:
-            docker_compose = yaml.safe_load(f)
-
-        # Update port mappings
-        if 'services' in docker_compose and 'v2ray' in docker_compose['services']:
-            # Replace port mapping
-            port_mapping = f"{min_port}-{max_port}:{min_port}-{max_port}"
-            with open(docker_compose_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-            content = content.replace(docker_compose['services']['v2ray']['ports'][0], port_mapping)
-
-            # Write back Docker Compose file
-            with open(docker_compose_file, "w", encoding='utf-8') as f:
-                f.write(content)
-
-            print(f"Updated Docker Compose port mappings to {port_mapping}")
+            content = f.read()
+
+        # Leave out the byte order mark some editors write, so node positions index into the text
+        bom = '\ufeff' if content.startswith('\ufeff') else ''
+        body = content[len(bom):]
+
+        # Replace only the v2ray service's port mapping, keeping the rest of the file as written
+        port_node = _find_v2ray_port_node(_compose_yaml(body))
+        if port_node is None:
+            _log(f"Warning: Docker Compose file '{docker_compose_file}' has no v2ray port mapping, port mappings will not be updated")
+            return
+        quote = port_node.style if port_node.style in ('"', "'") else ''
+        content = (bom + body[:port_node.start_mark.index] + quote + port_mapping + quote
+                   + body[port_node.end_mark.index:])
+
+        # Write back Docker Compose file
+        with open(docker_compose_file, "w", encoding='utf-8') as f:
+            f.write(content)
+
+        _log(f"Updated Docker Compose port mappings to {port_mapping}")
+    except FileNotFoundError:
+        _log(f"Warning: Docker Compose file '{docker_compose_file}' not found, port mappings will not be updated")
     except Exception as e:
-        print(f"Error updating Docker Compose file: {str(e)}")
+        _log(f"Error updating Docker Compose file: {str(e)}")
 
 
+@_flushes_log
 def convert_shadowsocks_to_v2ray(input_file: str, output_file: str, start_port: int = 10001,
                                 append_mode: bool = False, docker_compose_file: Optional[str] = None) -> Tuple[int, int]:
     """Convert Shadowsocks configuration to V2Ray configuration.
@@ -336,15 +467,8 @@ def convert_shadowsocks_to_v2ray(input_file: str, output_file: str, start_port:
     if not success:
         return 0, 0
 
-    # Filter out information nodes
-    valid_nodes = filter_info_nodes(ss_configs)
-
-    # Extract regions and group nodes
-    possible_regions = extract_regions(valid_nodes)
-    regions = group_nodes_by_region(valid_nodes, possible_regions)
-
-    # Select nodes from each region
-    valid_configs = select_nodes_from_regions(regions)
+    # Filter out information nodes, group nodes by region and select nodes from each region
+    valid_configs, region_count = select_region_nodes(ss_configs)
 
     # Load or create V2Ray configuration
     v2ray_config, start_port = load_or_create_v2ray_config(output_file, append_mode, start_port)
@@ -378,17 +502,26 @@ def convert_shadowsocks_to_v2ray(input_file: str, output_file: str, start_port:
     if docker_compose_file:
         update_docker_compose(docker_compose_file, v2ray_config, start_port)
 
-    return len(valid_configs), len(regions)
+    return len(valid_configs), region_count
 
-if __name__ == "__main__":
-    # Set up command line argument parser
+
+def get_parser() -> argparse.ArgumentParser:
+    """Build the command line argument parser.
+    Returns:
+        Argument parser for the converter options
+    """
     parser = argparse.ArgumentParser(description="Convert Shadowsocks configuration to V2Ray configuration")
     parser.add_argument("-i", "--input", default="shadowsocks.json", help="Input Shadowsocks JSON file")
     parser.add_argument("-o", "--output", default="config.json", help="Output V2Ray config file")
     parser.add_argument("-p", "--port", type=int, default=10001, help="Starting port number")
     parser.add_argument("-a", "--append", action="store_true", help="Append to existing config file instead of creating a new one")
     parser.add_argument("-d", "--docker", default="docker-compose.yaml", help="Docker Compose file to update with port mappings")
-    args = parser.parse_args()
+    return parser
+
+
+if __name__ == "__main__":
+    # Parse command line arguments
+    args = get_parser().parse_args()
 
     # Convert Shadowsocks configuration to V2Ray configuration
     node_count, region_count = convert_shadowsocks_to_v2ray(